@@ -1,15 +1,38 @@
 #!/usr/bin/env python3
 import sys
-import argparse
-import json
 from pathlib import Path
 from dataclasses import (
     dataclass,
-    asdict,
     field,
+    fields,
+    is_dataclass,
 )
 from enum import StrEnum
-from copy import deepcopy
+from operator import attrgetter
+from types import MappingProxyType
+from copy import copy
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import argparse
+
+try:
+    import orjson
+
+    def json_loads(data: bytes):
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2)
+
+except ImportError:
+    import json
+
+    def json_loads(data: bytes):
+        return json.loads(data)
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj, sort_keys=True, indent=2, ensure_ascii=False).encode()
 
 
 class Flag(StrEnum):
@@ -24,23 +47,14 @@ class Flag(StrEnum):
     UPDATE_ON_WAITING = "UpdateOnWaiting"
 
 
+FLAG_MAP = MappingProxyType({flag.lower(): flag for flag in Flag})
+
+
 def get_flag(string: str) -> Flag:
     """
     Return a flag enum representation of a case-insensitive string.
     """
-    flag_map = {
-        "ignorescale": Flag.IGNORE_SCALE,
-        "noexternalemittance": Flag.NO_EXTERNAL_EMITTANCE,
-        "portalstrict": Flag.PORTAL_STRICT,
-        "randomanimstart": Flag.RANDOM_ANIM_START,
-        "shadow": Flag.SHADOW,
-        "simple": Flag.SIMPLE,
-        "syncaddonnodes": Flag.SYNC_ADDON_NODES,
-        "updateoncelltransition": Flag.UPDATE_ON_CELL_TRANSITION,
-        "updateonwaiting": Flag.UPDATE_ON_WAITING,
-    }
-
-    return flag_map[string.lower()]
+    return FLAG_MAP[string.lower()]
 
 
 class Interpolation(StrEnum):
@@ -49,16 +63,16 @@ class Interpolation(StrEnum):
     STEP = "Step"
 
 
+INTERPOLATION_MAP = MappingProxyType(
+    {interpolation.lower(): interpolation for interpolation in Interpolation}
+)
+
+
 def get_interpolation(string: str) -> Interpolation:
     """
     Return an interpolation enum representation of a case-insensitive string.
     """
-    interpolation_map = {
-        "cubic": Interpolation.CUBIC,
-        "linear": Interpolation.LINEAR,
-        "step": Interpolation.STEP,
-    }
-    return interpolation_map[string.lower()]
+    return INTERPOLATION_MAP[string.lower()]
 
 
 class AttachmentType(StrEnum):
@@ -67,10 +81,15 @@ class AttachmentType(StrEnum):
     VISUAL_EFFECTS = "visualEffects"
 
 
+ATTACHMENT_GETTERS = MappingProxyType(
+    {attachment_type: attrgetter(attachment_type) for attachment_type in AttachmentType}
+)
+
+
 type Color = list[float] | list[int]
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Keyframe:
     backward: float
     forward: float
@@ -78,7 +97,7 @@ class Keyframe:
     value: float
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class PositionKeyframe:
     backward: float
     forward: float
@@ -86,7 +105,7 @@ class PositionKeyframe:
     translation: list[float]
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class RotationKeyframe:
     backward: float
     forward: float
@@ -94,7 +113,7 @@ class RotationKeyframe:
     rotation: list[float]
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class ColorKeyframe:
     backward: float
     forward: float
@@ -102,37 +121,37 @@ class ColorKeyframe:
     color: Color
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class PositionController:
     interpolation: Interpolation
     keys: list[PositionKeyframe]
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class RotationController:
     interpolation: Interpolation
     keys: list[RotationKeyframe]
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class ColorController:
     interpolation: Interpolation
     keys: list[ColorKeyframe]
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class RadiusController:
     interpolation: Interpolation
     keys: list[Keyframe] | None = None
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class FadeController:
     interpolation: Interpolation
     keys: list[Keyframe] | None = None
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Data:
     light: str
 
@@ -154,28 +173,23 @@ class Data:
     shadowDepthBias: float | None = None
 
     def __post_init__(self):
+        # Light names repeat across many entries, share one string for each.
+        if self.light is not None:
+            self.light = sys.intern(self.light)
+        if self.externalEmittance is not None:
+            self.externalEmittance = sys.intern(self.externalEmittance)
+
         if self.rotation is not None:
-            for i in self.rotation:
-                while abs(i) >= 360:
-                    # Converge astronomic degrees towards their smallest
-                    # equivalent representation.
-                    if i > 0:
-                        i -= 360
-                    elif i < 0:
-                        i += 360
-                    else:
-                        break
+            # Converge astronomic degrees towards their smallest
+            # equivalent representation, keeping the sign.
+            self.rotation = [i - 360 * int(i / 360) for i in self.rotation]
 
         if self.flags:
             # This will have been cast into a plain string, but
             # we want to separate and compare these flags,
             # asserting that they're a valid enum. Cast them
             # to list[Flag]
-            flags = self.flags.split("|")
-            for flag in flags:
-                flag = get_flag(flag)
-
-            self.flags = flags
+            self.flags = [get_flag(flag) for flag in self.flags.split("|")]
 
             if Flag.SHADOW in self.flags:
                 assert (
@@ -188,7 +202,7 @@ class Data:
             ), "'shadowDepthBias' set without 'Shadow' flag"
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Light:
     data: Data
 
@@ -199,19 +213,25 @@ class Light:
 
     def __post_init__(self):
         if self.blackList is not None:
-            self.blackList = sorted([i.lower() for i in self.blackList])
+            self.blackList = [sys.intern(i.lower()) for i in self.blackList]
+            self.blackList.sort()
 
         if self.whiteList is not None:
-            self.whiteList = sorted([i.lower() for i in self.whiteList])
+            self.whiteList = [sys.intern(i.lower()) for i in self.whiteList]
+            self.whiteList.sort()
+
+        if self.nodes is not None:
+            self.nodes = [sys.intern(i) for i in self.nodes]
 
         if self.points is not None:
             for i in self.points:
                 assert len(i) == 3, f"Expected 'points' to have 3 items, found {i}"
 
-            self.points = sorted(self.points, key=lambda x: (x[0], x[1], x[2]))
+            # Points are all [x, y, z], which already compare lexicographically.
+            self.points.sort()
 
 
-@dataclass(kw_only=True)
+@dataclass(kw_only=True, slots=True)
 class Entry:
     lights: list[Light]
 
@@ -228,6 +248,7 @@ class Entry:
 
         if self.models:
             self.attachment_type = AttachmentType.MODELS
+            self.models = [sys.intern(i) for i in self.models]
             self.models.sort()
 
             for light in self.lights:
@@ -239,86 +260,83 @@ class Entry:
 
         if self.visualEffects:
             self.attachment_type = AttachmentType.VISUAL_EFFECTS
+            self.visualEffects = [sys.intern(i) for i in self.visualEffects]
             self.visualEffects.sort()
 
 
+DATA_FIELDS = frozenset(f.name for f in fields(Data))
+LIGHT_FIELDS = frozenset(f.name for f in fields(Light)) - {"data"}
+CONTROLLERS = MappingProxyType(
+    {
+        "colorController": ColorController,
+        "fadeController": FadeController,
+        "positionController": PositionController,
+        "radiusController": RadiusController,
+        "rotationController": RotationController,
+    }
+)
+
+
+def get_data(data: dict) -> Data:
+    """
+    Given the raw "data" dict of a light, return a Data.
+    """
+    kwargs = {k: data[k] for k in data.keys() & DATA_FIELDS}
+    # Keep accepting data without a "light", as before.
+    kwargs.setdefault("light", None)
+    for k in kwargs.keys() & CONTROLLERS.keys():
+        kwargs[k] = CONTROLLERS[k](**c) if (c := kwargs[k]) else None
+
+    return Data(**kwargs)
+
+
+def get_light(light: dict) -> Light:
+    """
+    Given a raw light dict, return a Light.
+    """
+    return Light(
+        data=get_data(light["data"]),
+        **{k: light[k] for k in light.keys() & LIGHT_FIELDS},
+    )
+
+
+def get_entry(item: dict) -> Entry:
+    """
+    Given a raw top level item of a lightplacer config, return an Entry.
+    """
+    return Entry(
+        lights=[get_light(light) for light in item["lights"]],
+        visualEffects=item.get("visualEffects", None),
+        addonNodes=[int(addonNode) for addonNode in item.get("addonNodes", [])] or None,
+        models=item.get("models", None),
+    )
+
+
 def get_entries_from(path: Path) -> list[Entry]:
     """
     Given a file path, serialize the file into a list of Entries
     and return it.
     """
     print(f"Parsing '{str(path)}'", file=sys.stderr)
-    with open(path, "r", encoding="utf-8") as f:
-        contents = json.loads(f.read())
+    contents = json_loads(path.read_bytes())
 
     result: list[Entry] = []
 
-    for item in contents:
-        entry = Entry(
-            lights=[
-                Light(
-                    blackList=light.get("blackList", None),
-                    data=Data(
-                        color=light["data"].get("color", None),
-                        colorController=(
-                            ColorController(**light["data"].get("colorController", {}))
-                            if light["data"].get("colorController", None)
-                            else None
-                        ),
-                        conditionalNodes=light["data"].get("conditionalNodes", None),
-                        conditions=light["data"].get("conditions", None),
-                        externalEmittance=light["data"].get("externalEmittance", None),
-                        fade=light["data"].get("fade", None),
-                        flags=light["data"].get("flags", None),
-                        fov=light["data"].get("fov", None),
-                        light=light["data"].get("light"),
-                        offset=light["data"].get("offset", None),
-                        positionController=(
-                            PositionController(
-                                **light["data"].get("positionController", None, {})
-                            )
-                            if light["data"].get("positionController", None)
-                            else None
-                        ),
-                        radius=light["data"].get("radius", None),
-                        radiusController=(
-                            RadiusController(
-                                **light["data"].get("radiusController", None, {})
-                            )
-                            if light["data"].get("radiusController", None)
-                            else None
-                        ),
-                        rotation=light["data"].get("rotation", None),
-                        rotationController=(
-                            RotationController(
-                                **light["data"].get("rotationController", None, {})
-                            )
-                            if light["data"].get("rotationController", None)
-                            else None
-                        ),
-                        shadowDepthBias=light["data"].get("shadowDepthBias", None),
-                    ),
-                    nodes=light.get("nodes", None),
-                    points=light.get("points", None),
-                    whiteList=light.get("whiteList", None),
-                )
-                for light in item["lights"]
-            ],
-            visualEffects=item.get("visualEffects", None),
-            addonNodes=[int(addonNode) for addonNode in item.get("addonNodes", [])]
-            or None,
-            models=item.get("models", None),
-        )
-
-        result.append(entry)
+    # Pop items off the parsed document as they're converted, so the raw
+    # dicts can be freed one by one instead of living until we return.
+    contents.reverse()
+    while contents:
+        result.append(get_entry(contents.pop()))
 
     return result
 
 
-def parse_args(sys_argv: list[str]) -> argparse.Namespace:
+def parse_args(sys_argv: list[str]) -> "argparse.Namespace":
     """
     Arg parser.
     """
+    import argparse
+
     parser = argparse.ArgumentParser(
         prog=Path(__file__).name,
         epilog="redirect stdout to a new json file and load it in 'Data/lightplacer/' instead of input jsons",
@@ -349,7 +367,7 @@ def parse_args(sys_argv: list[str]) -> argparse.Namespace:
         default=[],
     )
 
-    return parser.parse_args()
+    return parser.parse_args(sys_argv[1:])
 
 
 def expand(entry: Entry) -> list[Entry]:
@@ -359,10 +377,12 @@ def expand(entry: Entry) -> list[Entry]:
     from the original entry.
     """
     result = []
-    for attr in ("addonNodes", "models", "visualEffects"):
-        if (a := getattr(entry, attr)) is not None and len(a) > 0:
+    for attr, get in ATTACHMENT_GETTERS.items():
+        if (a := get(entry)) is not None and len(a) > 0:
             for item in a:
-                new_entry = deepcopy(entry)
+                # Only the list being expanded is replaced, so the lights
+                # can be shared between the new entries.
+                new_entry = copy(entry)
                 setattr(new_entry, attr, [item])
                 result.append(new_entry)
             return result
@@ -371,6 +391,25 @@ def expand(entry: Entry) -> list[Entry]:
     return [entry]
 
 
+def freeze(obj):
+    """
+    Return a hashable representation of obj which compares equal
+    wherever the dataclass equality of the original would.
+    """
+    if is_dataclass(obj):
+        return (type(obj),) + tuple(
+            freeze(getattr(obj, f.name)) for f in fields(obj) if f.compare
+        )
+
+    if isinstance(obj, list):
+        return tuple(freeze(i) for i in obj)
+
+    if isinstance(obj, dict):
+        return frozenset((k, freeze(v)) for k, v in obj.items())
+
+    return obj
+
+
 def collapse(entries: list[Entry]) -> list[Entry]:
     """
     We have a list of entries where each model,
@@ -380,31 +419,39 @@ def collapse(entries: list[Entry]) -> list[Entry]:
 
     Return a new list of those entries.
     """
-    result: list[Entry] = []
+    groups: dict[tuple, Entry] = {}
+    # Entries expanded from the same original share one lights list,
+    # only freeze each of those lists once.
+    frozen_lights: dict[int, tuple] = {}
 
-    for index, entry in enumerate(entries):
-        for other_entry in entries[index + 1 :]:
-            if entry == other_entry:
-                if (original := getattr(entry, entry.attachment_type, None)) and (
-                    new := getattr(other_entry, other_entry.attachment_type, None)
-                ):
-                    original.extend(new)
-                    # de-duplicate the list, because getattr apparently gave us a copy
-                    # instead of a reference.
-                    original = sorted(list(set(original)))
-                    setattr(entry, entry.attachment_type, original)
-
-        if entry not in result:
-            result.append(entry)
+    for entry in entries:
+        if (lights := frozen_lights.get(id(entry.lights))) is None:
+            lights = frozen_lights[id(entry.lights)] = freeze(entry.lights)
 
-    return result
+        key = (lights, entry.attachment_type)
 
+        if (group := groups.get(key)) is None:
+            groups[key] = entry
+            continue
 
-def serialize[T](
-    iterable: T, flags_to_add: list[Flag], flags_to_remove: list[Flag]
-) -> T:
+        # Entries in a group share an attachment type, it's part of the key.
+        get = ATTACHMENT_GETTERS[entry.attachment_type]
+        if (original := get(group)) and (new := get(entry)):
+            # Don't extend in place, expanded entries may share lists.
+            setattr(group, group.attachment_type, original + new)
+
+    for entry in groups.values():
+        if attachments := ATTACHMENT_GETTERS[entry.attachment_type](entry):
+            setattr(entry, entry.attachment_type, sorted(set(attachments)))
+
+    return list(groups.values())
+
+
+def serialize(
+    iterable: object, flags_to_add: list[Flag], flags_to_remove: list[Flag]
+) -> object:
     """
-    Return a new dict:
+    Return a new dict built directly from a dataclass (or dict):
         - without keys with null values
         - with list[Flag] as 'flag1|flag2|flag3'
         - without .attachment_type
@@ -415,9 +462,14 @@ def serialize[T](
             result.append(serialize(i, flags_to_add, flags_to_remove))
         return result
 
-    elif isinstance(iterable, dict):
+    elif is_dataclass(iterable) or isinstance(iterable, dict):
+        if isinstance(iterable, dict):
+            items = iterable.items()
+        else:
+            items = ((f.name, getattr(iterable, f.name)) for f in fields(iterable))
+
         result = {}
-        for k, v in iterable.items():
+        for k, v in items:
             if v is None:
                 continue
 
@@ -425,12 +477,10 @@ def serialize[T](
                 continue
 
             if k == "flags":
-                for flag in flags_to_add:
-                    v.append(flag)
-
-                for flag in flags_to_remove:
-                    while flag in v:
-                        v.remove(flag)
+                # Build a new list, lights may be shared between entries.
+                v = [
+                    flag for flag in (*v, *flags_to_add) if flag not in flags_to_remove
+                ]
 
                 # de-duplicate flags
                 v = sorted(list(set(v)))
@@ -467,36 +517,45 @@ def main(sys_argv: list[str]):
         expanded_config.extend(expand(entry))
 
     deduped_config: list[Entry] = []
-    for index, entry in enumerate(expanded_config):
-        for attr in ("addonNodes", "models", "visualEffects"):
-            if (a := getattr(entry, attr)) is None:
+    # Every addonNode, model, and visualEffect already included
+    # in our unique entries, by attribute name.
+    seen: dict[str, set[int | str]] = {attr: set() for attr in AttachmentType}
+    for entry in expanded_config:
+        for attr, get in ATTACHMENT_GETTERS.items():
+            if (a := get(entry)) is None:
                 continue
 
             # If this addonNode, model, or visualEffect hasn't been included
             # in our unique entries yet, include it.
-            current_stuff = []
-            for element in deduped_config:
-                current_stuff.extend(getattr(element, attr, []) or [])
-
-            if a[0] in current_stuff:
+            if a[0] in seen[attr]:
                 continue
 
             deduped_config.append(entry)
+            for other, get_other in ATTACHMENT_GETTERS.items():
+                seen[other].update(get_other(entry) or [])
 
+    # sorted() computes each key once per entry, not once per comparison.
     sorted_config = sorted(
         deduped_config,
         key=lambda x: (
-            (getattr(x, "addonNodes", [0]) or [0])[0],
-            (getattr(x, "models", [""]) or [""])[0].lower(),
-            (getattr(x, "visualEffects", [0]) or [0])[0],
+            (x.addonNodes or [0])[0],
+            (x.models or [""])[0].lower(),
+            (x.visualEffects or [""])[0],
         ),
     )
 
     clean_config = [
-        serialize(asdict(entry), args.add_flags, args.remove_flags)
+        serialize(entry, args.add_flags, args.remove_flags)
         for entry in collapse(sorted_config)
     ]
-    print(json.dumps(clean_config, sort_keys=True, indent=2))
+    # Write UTF-8 bytes directly, the console encoding (e.g. cp1252 on
+    # Windows) can't represent every name and isn't what json readers expect.
+    out = json_dumps(clean_config) + b"\n"
+    if (buffer := getattr(sys.stdout, "buffer", None)) is not None:
+        buffer.write(out)
+    else:
+        # Plain text streams, e.g. contextlib.redirect_stdout(io.StringIO()).
+        sys.stdout.write(out.decode())
 
 
 if __name__ == "__main__":
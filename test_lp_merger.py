@@ -0,0 +1,26 @@
+from lp_merger import Data
+
+
+def test_rotation_positive_over_360():
+    assert Data(light="light", rotation=[370, 725, 359]).rotation == [10, 5, 359]
+
+
+def test_rotation_negative_over_360():
+    assert Data(light="light", rotation=[-370, -725, -359]).rotation == [-10, -5, -359]
+
+
+def test_rotation_exact_multiple_of_360():
+    assert Data(light="light", rotation=[360, -720, 0]).rotation == [0, 0, 0]
+
+
+def test_rotation_floats():
+    assert Data(light="light", rotation=[12.5, -90.25, 400.5]).rotation == [
+        12.5,
+        -90.25,
+        40.5,
+    ]
+
+
+def test_rotation_int_stays_int():
+    rotation = Data(light="light", rotation=[370, -720, 45]).rotation
+    assert all(type(i) is int for i in rotation)